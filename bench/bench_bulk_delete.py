@@ -0,0 +1,58 @@
+"""
+Throughput of delete_files_in_bucket (/delete-all-files) on a bucket of 100k+
+objects, for one or more DELETE_CONCURRENCY values.
+
+    python bench/bench_bulk_delete.py --objects 100000 --concurrency 1,8
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_bucket, import_main, parse_args, print_table, start_s3_stand_in
+
+
+def configure(parser):
+    parser.add_argument('--objects', type=int, default=100000)
+    parser.add_argument('--concurrency', default='8', help='comma-separated DELETE_CONCURRENCY values')
+    parser.add_argument('--versions', action='store_true', help='use a versioned bucket and delete every version')
+
+
+def populate(s3, bucket_name, count):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        list(pool.map(lambda i: s3.put_object(Bucket=bucket_name, Key=f'part={i % 100:02d}/object-{i:07d}', Body=b''), range(count)))
+    return time.perf_counter() - started
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        app_module = import_main()
+        s3 = app_module.get_s3_client('aws')
+
+        results = []
+        for concurrency in [int(value) for value in args.concurrency.split(',')]:
+            bucket_name = f'bench-delete-{concurrency}-{int(time.time())}'
+            create_bucket(s3, bucket_name)
+            if args.versions:
+                s3.put_bucket_versioning(Bucket=bucket_name, VersioningConfiguration={'Status': 'Enabled'})
+            populate_seconds = populate(s3, bucket_name, args.objects)
+            print(f'Put {args.objects} objects into {bucket_name} in {populate_seconds:.1f}s')
+
+            app_module.DELETE_CONCURRENCY = concurrency
+            result = app_module.delete_files_in_bucket(bucket_name, versions=args.versions)
+            remaining = s3.list_objects_v2(Bucket=bucket_name).get('KeyCount', 0)
+            results.append([
+                concurrency, result['listed'], result['deleted'], result['error_count'], remaining,
+                f"{result['seconds']:.1f}", result['objects_per_second']
+            ])
+
+        print(f'delete_files_in_bucket against {endpoint}')
+        print_table(['concurrency', 'listed', 'deleted', 'errors', 'remaining', 'seconds', 'objects/sec'], results)
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
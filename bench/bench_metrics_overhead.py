@@ -0,0 +1,107 @@
+"""
+Overhead of the metrics hooks: --calls head_object calls against a local S3
+stand-in with a client that has instrument_s3_client's handlers and one that
+doesn't, and --calls Flask test-client requests to /health with the request
+metrics hooks registered and removed.
+
+    python bench/bench_metrics_overhead.py --calls 2000 --rounds 5
+
+On and off alternate for --rounds rounds and the best round of each is kept, so
+a noisy neighbour or a GC pause doesn't land on one side only.
+"""
+import time
+
+from common import create_bucket, import_main, parse_args, print_table, start_s3_stand_in
+
+BUCKET = 'bench-metrics'
+
+
+def configure(parser):
+    parser.add_argument('--calls', type=int, default=2000, help='calls per round')
+    parser.add_argument('--rounds', type=int, default=5, help='alternating on/off rounds')
+
+
+def build_client(app_module, instrumented):
+    import boto3
+
+    # As get_s3_client builds them, minus the rate limiter, so only the metrics hooks differ
+    client = boto3.session.Session().client('s3', region_name='us-east-1', config=app_module.s3_client_config())
+    if instrumented:
+        app_module.instrument_s3_client(client)
+    return client
+
+
+def best_seconds(rounds, run_on, run_off):
+    on, off = [], []
+    for _ in range(rounds):
+        for run, times in ((run_on, on), (run_off, off)):
+            started = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - started)
+    return min(on), min(off)
+
+
+def request_hooks_removed(app_module):
+    # Take the metrics hooks out of the app's hook lists; returns a function that puts them back
+    app = app_module.app
+    before, after = app.before_request_funcs[None], app.after_request_funcs[None]
+    before_index = before.index(app_module.start_request_metrics)
+    after_index = after.index(app_module.finish_request_metrics)
+    before.pop(before_index)
+    after.pop(after_index)
+
+    def restore():
+        before.insert(before_index, app_module.start_request_metrics)
+        after.insert(after_index, app_module.finish_request_metrics)
+    return restore
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        app_module = import_main()
+        instrumented = build_client(app_module, instrumented=True)
+        plain = build_client(app_module, instrumented=False)
+        create_bucket(plain, BUCKET)
+        plain.put_object(Bucket=BUCKET, Key='object', Body=b'x')
+
+        def head_objects(client):
+            return lambda: [client.head_object(Bucket=BUCKET, Key='object') for _ in range(args.calls)]
+
+        results = []
+        on, off = best_seconds(args.rounds, head_objects(instrumented), head_objects(plain))
+        results.append(['head_object', on, off])
+
+        client = app_module.app.test_client()
+
+        def requests_on():
+            for _ in range(args.calls):
+                client.get('/health')
+
+        def requests_off():
+            restore = request_hooks_removed(app_module)
+            try:
+                requests_on()
+            finally:
+                restore()
+
+        on, off = best_seconds(args.rounds, requests_on, requests_off)
+        results.append(['test client GET /health', on, off])
+
+        print(f'{args.calls} calls per round, best of {args.rounds} rounds; S3 at {endpoint}')
+        print_table(
+            ['call', 'hooks on us/call', 'hooks off us/call', 'overhead us/call', 'overhead'],
+            [
+                [name, f'{on / args.calls * 1e6:.1f}', f'{off / args.calls * 1e6:.1f}',
+                 f'{(on - off) / args.calls * 1e6:.1f}', f'{(on - off) / off:.1%}']
+                for name, on, off in results
+            ]
+        )
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+Kill and resume of resumable_upload_file and resumable_download_file: each
+transfer is started in a child process that is SIGKILLed once --kill-after parts
+are done, then run again here against the same checkpoint.
+
+    python bench/bench_resume.py --size-mb 128 --part-mb 8 --kill-after 4
+
+Checks that the uploaded object and the downloaded file match the source, and
+that the second run neither re-sends nor re-fetches the parts that were done
+before the kill; exits non-zero otherwise.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+
+from common import MB, REPO_ROOT, create_bucket, import_main, parse_args, print_table, start_s3_stand_in
+
+BUCKET = 'bench-resume'
+KEY = 'resume.bin'
+
+
+def configure(parser):
+    parser.add_argument('--size-mb', type=int, default=128, help='size of the transferred file')
+    parser.add_argument('--part-mb', type=int, default=8, help='multipart part size')
+    parser.add_argument('--threads', type=int, default=2, help='parts in flight at once')
+    parser.add_argument('--kill-after', type=int, default=4, help='parts done before the child is killed')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'bench', 'data', 'resume'))
+
+
+def transfer_config(args):
+    from boto3.s3.transfer import TransferConfig
+
+    return TransferConfig(
+        multipart_threshold=args.part_mb * MB, multipart_chunksize=args.part_mb * MB,
+        max_concurrency=args.threads, use_threads=True
+    )
+
+
+def run_transfer(kind, directory, args):
+    # Child process: the same call the second run makes, killed before it returns
+    os.chdir(directory)
+    app_module = import_main()
+    s3 = app_module.get_s3_client('aws')
+    if kind == 'upload':
+        app_module.resumable_upload_file(s3, 'source.bin', BUCKET, KEY, config=transfer_config(args))
+    else:
+        app_module.resumable_download_file(s3, BUCKET, KEY, 'download.bin', config=transfer_config(args))
+
+
+def kill_partway(kind, directory, args, parts_done):
+    """
+    Run the transfer in a child and SIGKILL it once parts_done() reaches
+    --kill-after. Returns the parts done at the kill, or None if it finished first.
+    """
+    process = multiprocessing.get_context('spawn').Process(target=run_transfer, args=(kind, directory, args))
+    process.start()
+    try:
+        while process.is_alive():
+            done = parts_done()
+            if done >= args.kill_after:
+                process.kill()
+                process.join()
+                return done
+            time.sleep(0.02)
+        return None
+    finally:
+        process.join()
+
+
+def multipart_etag(path, part_size):
+    # The ETag S3 gives a multipart upload of path in part_size parts
+    digests = []
+    with open(path, 'rb') as file:
+        for part in iter(lambda: file.read(part_size), b''):
+            digests.append(hashlib.md5(part).digest())
+    return f'{hashlib.md5(b"".join(digests)).hexdigest()}-{len(digests)}'
+
+
+def count_calls(s3, operation):
+    # Records each call of one S3 operation on s3; returns (calls, stop)
+    calls = []
+
+    def handler(**kwargs):
+        calls.append(operation)
+
+    s3.meta.events.register(f'before-call.s3.{operation}', handler)
+    return calls, lambda: s3.meta.events.unregister(f'before-call.s3.{operation}', handler)
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        directory = os.path.abspath(args.data_dir)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        # Checkpoints go to state/transfers relative to the working directory, as in the app
+        os.chdir(directory)
+        with open('source.bin', 'wb') as file:
+            file.write(os.urandom(args.size_mb * MB))
+
+        app_module = import_main()
+        s3 = app_module.get_s3_client('aws')
+        create_bucket(s3, BUCKET)
+        config = transfer_config(args)
+        part_size = args.part_mb * MB
+        part_count = -(-args.size_mb * MB // part_size)
+        source_md5 = app_module.local_file_checksums('source.bin')[0]
+        source_etag = multipart_etag('source.bin', part_size)
+        results = []
+        failures = []
+
+        def uploaded_parts():
+            uploads = s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', [])
+            if not uploads:
+                return 0
+            parts = app_module.list_uploaded_parts(s3, BUCKET, KEY, uploads[0]['UploadId'])
+            return len(parts or {})
+
+        killed_at = kill_partway('upload', directory, args, uploaded_parts)
+        held = uploaded_parts()
+        calls, stop = count_calls(s3, 'UploadPart')
+        started = time.perf_counter()
+        resumed_bytes = app_module.resumable_upload_file(s3, 'source.bin', BUCKET, KEY, config=config)
+        elapsed = time.perf_counter() - started
+        stop()
+        results.append(['upload', killed_at, held, resumed_bytes // MB, len(calls), part_count, f'{elapsed:.2f}'])
+        if killed_at is None:
+            failures.append('upload finished before it was killed; raise --size-mb')
+        etag = s3.head_object(Bucket=BUCKET, Key=KEY)['ETag'].strip('"')
+        if etag != source_etag:
+            failures.append('uploaded object does not match the source file')
+        if not resumed_bytes or len(calls) != part_count - held:
+            failures.append(f'upload re-sent {len(calls)} parts with {held} of {part_count} already uploaded')
+
+        download_checkpoint = app_module.checkpoint_path('download', os.path.abspath('download.bin'))
+
+        def downloaded_parts():
+            try:
+                with open(download_checkpoint) as file:
+                    return len(json.load(file).get('parts', []))
+            except (OSError, ValueError):
+                return 0
+
+        killed_at = kill_partway('download', directory, args, downloaded_parts)
+        held = downloaded_parts()
+        calls, stop = count_calls(s3, 'GetObject')
+        started = time.perf_counter()
+        size, resumed_bytes = app_module.resumable_download_file(s3, BUCKET, KEY, 'download.bin', config=config)
+        elapsed = time.perf_counter() - started
+        stop()
+        results.append(['download', killed_at, held, resumed_bytes // MB, len(calls), part_count, f'{elapsed:.2f}'])
+        if killed_at is None:
+            failures.append('download finished before it was killed; raise --size-mb')
+        if app_module.local_file_checksums('download.bin')[0] != source_md5:
+            failures.append('downloaded file does not match the source file')
+        if not resumed_bytes or len(calls) != part_count - held:
+            failures.append(f'download re-fetched {len(calls)} parts with {held} of {part_count} already on disk')
+
+        print(f'{args.size_mb} MB in {args.part_mb} MB parts, {args.threads} in flight, '
+              f'child killed after {args.kill_after} parts; S3 at {endpoint}')
+        print_table(
+            ['transfer', 'parts at kill', 'parts kept', 'resumed MB', 'parts sent on resume', 'parts', 'resume s'],
+            results
+        )
+        for failure in failures:
+            print(f'FAILED: {failure}')
+        if failures:
+            sys.exit(1)
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
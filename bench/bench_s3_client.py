@@ -0,0 +1,67 @@
+"""
+Requests/sec of an S3-backed endpoint with a fresh boto3 client per request (the
+old behaviour) versus the shared, pooled clients from get_s3_client().
+
+    python bench/bench_s3_client.py --requests 400 --threads 8
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import create_bucket, import_main, parse_args, print_table, start_s3_stand_in
+
+
+def configure(parser):
+    parser.add_argument('--requests', type=int, default=400, help='requests per run')
+    parser.add_argument('--threads', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--objects', type=int, default=50, help='objects in the listed bucket')
+
+
+def run(app, url, requests, threads):
+    def worker(count):
+        client = app.test_client()
+        for _ in range(count):
+            response = client.get(url)
+            assert response.status_code == 200, response.get_data(as_text=True)
+
+    per_thread = [requests // threads + (1 if i < requests % threads else 0) for i in range(threads)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, per_thread))
+    return requests / (time.perf_counter() - started)
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        import boto3
+        app_module = import_main()
+        shared_client = app_module.get_s3_client
+
+        s3 = shared_client('aws')
+        bucket_name = f'bench-client-{int(time.time())}'
+        create_bucket(s3, bucket_name)
+        for i in range(args.objects):
+            s3.put_object(Bucket=bucket_name, Key=f'objects/{i:05d}', Body=b'x')
+
+        def fresh_client(profile='aws', region_name='ap-southeast-2'):
+            # What every handler did before: a new session and client per request
+            return boto3.session.Session().client('s3', region_name=region_name)
+
+        url = f'/list-bucket?bucket-name={bucket_name}'
+        results = []
+        for label, factory in (('fresh client per request', fresh_client), ('shared pooled client', shared_client)):
+            app_module.get_s3_client = factory
+            run(app_module.app, url, args.threads, args.threads)  # warm up
+            results.append([label, f'{run(app_module.app, url, args.requests, args.threads):.1f}'])
+        app_module.get_s3_client = shared_client
+
+        print(f'GET /list-bucket against {endpoint}, {args.requests} requests on {args.threads} threads')
+        print_table(['client', 'requests/sec'], results)
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
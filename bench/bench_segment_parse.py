@@ -0,0 +1,47 @@
+"""
+Speedup of parallel_segment_stats (/segment-stats) at 1, 2, 4 and 8 worker
+processes on a synthetic full segment file.
+
+    python bench/bench_segment_parse.py --rows 5000000 --workers 1,2,4,8
+
+Speedup is bounded by the cores available; the CPU count is printed with the results.
+"""
+import os
+
+from common import REPO_ROOT, import_main, parse_args, print_table
+from synthetic import ensure_assets
+
+
+def configure(parser):
+    parser.add_argument('--rows', type=int, default=5000000, help='rows in the synthetic segment file')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma-separated worker counts')
+    parser.add_argument('--repeat', type=int, default=2, help='runs per worker count; the fastest is kept')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'bench', 'data', 'segment_parse'))
+
+
+def main():
+    args = parse_args(__doc__, configure, s3=False)
+    worker_counts = [int(value) for value in args.workers.split(',')]
+    segment_path, _ = ensure_assets(os.path.join(args.data_dir, 'assets'), args.rows)
+    # Lift the workers=N cap to the largest count being measured
+    os.environ['SEGMENT_PARSE_WORKERS'] = str(max(worker_counts))
+    app_module = import_main()
+
+    # Start the pool's processes before timing anything
+    app_module.parallel_segment_stats(segment_path, max(worker_counts))
+
+    results = []
+    baseline = None
+    for workers in worker_counts:
+        seconds = min(
+            app_module.parallel_segment_stats(segment_path, workers)['seconds'] for _ in range(args.repeat)
+        )
+        baseline = baseline or seconds
+        results.append([workers, f'{seconds:.2f}', f'{args.rows / seconds:,.0f}', f'{baseline / seconds:.2f}x'])
+
+    print(f'parallel_segment_stats, {args.rows} rows, {os.cpu_count()} CPUs')
+    print_table(['workers', 'seconds', 'rows/sec', 'speedup'], results)
+
+
+if __name__ == '__main__':
+    main()
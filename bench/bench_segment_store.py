@@ -0,0 +1,93 @@
+"""
+Rebuild and sync time and memory of the segment store (/segment-store/sync) per
+million IPs: a synthetic full file is loaded with rebuild_segment_store, then
+--incs inc files of --inc-ips IPs each are applied.
+
+    python bench/bench_segment_store.py --ips 1000000,2000000 --incs 3
+
+Each size runs in a fresh process, so its peak RSS is its own. The full file is
+streamed in batches, so peak RSS stays close to flat and its per-million figure
+mostly shows the interpreter's baseline spread over fewer IPs at small sizes.
+Rows with no segments are dropped, so the store holds fewer IPs than the file.
+"""
+import multiprocessing
+import os
+import shutil
+import time
+
+from common import MB, REPO_ROOT, import_main, parse_args, print_table
+from synthetic import make_segment_file, segment_file_name
+
+
+def configure(parser):
+    parser.add_argument('--ips', default='1000000', help='comma-separated IP counts of the full file')
+    parser.add_argument('--incs', type=int, default=3, help='inc files applied after the rebuild')
+    parser.add_argument('--inc-ips', type=int, default=100000, help='IPs changed by each inc file')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'bench', 'data', 'segment_store'))
+
+
+def ensure_files(directory, ips, incs, inc_ips):
+    # Incs rewrite the first inc_ips IPs of the full file; rows left empty remove the IP
+    assets = os.path.join(directory, 'assets')
+    os.makedirs(assets, exist_ok=True)
+    wanted = [(segment_file_name('20240207', 'full', 1), ips, 1)]
+    wanted += [(segment_file_name('20240208', 'inc', version), inc_ips, 100 + version) for version in range(1, incs + 1)]
+    for name, rows, seed in wanted:
+        marker = os.path.join(assets, f'.{name}.rows-{rows}')
+        if not os.path.exists(marker):
+            make_segment_file(os.path.join(assets, name), rows, seed=seed)
+            open(marker, 'w').close()
+    for name in os.listdir(assets):
+        if name.startswith('inc.') and name not in {entry[0] for entry in wanted}:
+            os.remove(os.path.join(assets, name))
+
+
+def measure(directory):
+    # Runs in a child process: a fresh store, then one sync that rebuilds and applies the incs
+    os.chdir(directory)
+    shutil.rmtree('state', ignore_errors=True)
+    app_module = import_main()
+    started = time.perf_counter()
+    result = app_module.sync_segment_store('assets')
+    result['sync_seconds'] = time.perf_counter() - started
+    result['sync_peak_rss_bytes'] = app_module.peak_rss_bytes()
+    return result
+
+
+def main():
+    args = parse_args(__doc__, configure, s3=False)
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for ips in [int(value) for value in args.ips.split(',')]:
+        directory = os.path.join(args.data_dir, str(ips))
+        ensure_files(directory, ips, args.incs, args.inc_ips)
+        with context.Pool(1) as pool:
+            result = pool.apply(measure, (directory,))
+
+        rebuilt = result['rebuilt']
+        per_million = 1e6 / rebuilt['ips']
+        inc_seconds = sum(applied['seconds'] for applied in result['newly_applied'])
+        inc_rows = sum(applied['upserted'] + applied['removed'] for applied in result['newly_applied'])
+        results.append([
+            rebuilt['ips'],
+            f"{rebuilt['seconds']:.2f}",
+            f"{rebuilt['seconds_per_million_ips']:.2f}",
+            f"{rebuilt['peak_rss_bytes'] / MB:.0f}",
+            f"{rebuilt['peak_rss_bytes'] * per_million / MB:.0f}",
+            f"{rebuilt['store_bytes_per_million_ips'] / MB:.0f}",
+            f"{len(result['newly_applied'])} x {args.inc_ips}",
+            f'{inc_seconds:.2f}',
+            f'{inc_rows / inc_seconds:,.0f}' if inc_seconds else '',
+            f"{result['sync_peak_rss_bytes'] / MB:.0f}"
+        ])
+
+    print('rebuild_segment_store and sync_segment_store')
+    print_table(
+        ['IPs', 'rebuild s', 's per M IPs', 'peak RSS MB', 'per M IPs', 'store MB per M IPs',
+         'incs', 'inc apply s', 'inc rows/sec', 'sync peak RSS MB'],
+        results
+    )
+
+
+if __name__ == '__main__':
+    main()
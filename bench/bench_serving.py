@@ -0,0 +1,131 @@
+"""
+Cold start and requests/sec of the app served by waitress (python main.py) and
+by gunicorn (gunicorn -c gunicorn.conf.py main:app), against a local S3 stand-in.
+
+    python bench/bench_serving.py --requests 2000 --clients 8
+
+Cold start is the time from spawning the server to the first 200 from /health.
+/list-triton-files is served from the bucket index, which is filled by one
+request before timing. gunicorn is skipped when it is not installed.
+"""
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from common import REPO_ROOT, create_bucket, free_port, import_main, parse_args, print_table, start_s3_stand_in
+
+ENDPOINTS = ['/health', '/list-triton-files']
+
+
+def configure(parser):
+    parser.add_argument('--servers', default='waitress,gunicorn', help='comma-separated: waitress, gunicorn')
+    parser.add_argument('--requests', type=int, default=2000, help='requests per endpoint')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent keep-alive connections')
+    parser.add_argument('--objects', type=int, default=1000, help='objects in the Triton listing')
+
+
+def server_command(server):
+    if server == 'waitress':
+        return [sys.executable, os.path.join(REPO_ROOT, 'main.py')]
+    return [
+        sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_ROOT, 'gunicorn.conf.py'),
+        '--pythonpath', REPO_ROOT, 'main:app'
+    ]
+
+
+def get(port, path, timeout=5):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+    finally:
+        conn.close()
+
+
+def wait_for_health(port, process, limit=60):
+    started = time.perf_counter()
+    while time.perf_counter() - started < limit:
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with {process.returncode} before answering /health')
+        try:
+            if get(port, '/health', timeout=1) == 200:
+                return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.01)
+    raise RuntimeError('server did not answer /health in time')
+
+
+def requests_per_second(port, path, total, clients):
+    def client(count):
+        # One keep-alive connection per client, as a load balancer would hold
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        try:
+            for _ in range(count):
+                conn.request('GET', path)
+                response = conn.getresponse()
+                response.read()
+                assert response.status == 200, f'{path} returned {response.status}'
+        finally:
+            conn.close()
+
+    shares = [total // clients + (1 if i < total % clients else 0) for i in range(clients)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, shares))
+    return total / (time.perf_counter() - started)
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        app_module = import_main()
+        s3 = app_module.get_s3_client('triton', region_name=None)
+        create_bucket(s3, 'prod')
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            list(pool.map(
+                lambda i: s3.put_object(Bucket='prod', Key=f'near/2024020{i % 7 + 1}/file-{i:06d}.gz', Body=b''),
+                range(args.objects)
+            ))
+
+        results = []
+        for server in args.servers.split(','):
+            if server == 'gunicorn' and subprocess.call(
+                [sys.executable, '-c', 'import gunicorn'], stderr=subprocess.DEVNULL
+            ):
+                print('gunicorn is not installed, skipping it')
+                continue
+            port = free_port()
+            env = dict(os.environ, WEB_HOST='127.0.0.1', WEB_PORT=str(port), SHUTDOWN_DRAIN_SECONDS='5')
+            # A scratch working directory keeps the server's state/ out of the repository
+            with tempfile.TemporaryDirectory() as workdir:
+                server_process = subprocess.Popen(
+                    server_command(server), cwd=workdir, env=env,
+                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+                )
+                try:
+                    cold_start = wait_for_health(port, server_process)
+                    assert get(port, '/list-triton-files', timeout=60) == 200, '/list-triton-files failed'
+                    rates = [requests_per_second(port, path, args.requests, args.clients) for path in ENDPOINTS]
+                finally:
+                    server_process.send_signal(signal.SIGTERM)
+                    server_process.wait(timeout=30)
+            results.append([server, f'{cold_start:.2f}'] + [f'{rate:,.0f}' for rate in rates])
+
+        print(f'{args.requests} requests per endpoint over {args.clients} connections, '
+              f'{args.objects} objects in the listing, S3 at {endpoint}')
+        print_table(['server', 'cold start s'] + [f'{path} req/s' for path in ENDPOINTS], results)
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
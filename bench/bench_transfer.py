@@ -0,0 +1,103 @@
+"""
+Sweep multipart part sizes and thread counts for resumable_upload_file and
+resumable_download_file on synthetic files, and show what transfer_settings_for()
+picks for each size.
+
+    python bench/bench_transfer.py --sizes 100,1024 --part-sizes 8,16,32,64 --threads 4,8,16
+
+Sizes and part sizes are in MB. Files are written to --data-dir once and reused.
+"""
+import os
+import time
+
+from common import MB, REPO_ROOT, create_bucket, import_main, parse_args, print_table, start_s3_stand_in
+
+
+def configure(parser):
+    parser.add_argument('--sizes', default='100', help='comma-separated file sizes in MB (e.g. 100,1024,5120)')
+    parser.add_argument('--part-sizes', default='8,16,32,64', help='comma-separated part sizes in MB')
+    parser.add_argument('--threads', default='4,8,16', help='comma-separated thread counts')
+    parser.add_argument('--direction', choices=('upload', 'download', 'both'), default='both')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'bench', 'data', 'transfer'))
+
+
+def synthetic_file(directory, size_mb):
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'synthetic-{size_mb}mb.bin')
+    if not os.path.exists(path) or os.path.getsize(path) != size_mb * MB:
+        block = os.urandom(MB)
+        with open(path, 'wb') as file:
+            for i in range(size_mb):
+                # Vary each block so no layer can deduplicate them
+                file.write(i.to_bytes(8, 'big') + block[8:])
+    return path
+
+
+def timed(func):
+    started = time.perf_counter()
+    func()
+    return time.perf_counter() - started
+
+
+def main():
+    args = parse_args(__doc__, configure)
+    endpoint, process = start_s3_stand_in(args)
+    try:
+        from boto3.s3.transfer import TransferConfig
+
+        app_module = import_main()
+        s3 = app_module.get_s3_client('aws')
+        bucket_name = f'bench-transfer-{int(time.time())}'
+        create_bucket(s3, bucket_name)
+
+        part_sizes = [int(value) for value in args.part_sizes.split(',')]
+        thread_counts = [int(value) for value in args.threads.split(',')]
+        for size_mb in [int(value) for value in args.sizes.split(',')]:
+            path = synthetic_file(args.data_dir, size_mb)
+            download_path = f'{path}.download'
+            key = os.path.basename(path)
+            picked = app_module.transfer_settings_for(size_mb * MB)
+            combinations = [(part_size * MB, threads) for part_size in part_sizes for threads in thread_counts]
+            if picked not in combinations:
+                combinations.append(picked)
+
+            rows = []
+            for part_size, threads in combinations:
+                config = TransferConfig(
+                    multipart_threshold=app_module.S3_MULTIPART_THRESHOLD,
+                    multipart_chunksize=part_size,
+                    max_concurrency=threads
+                )
+                row = [part_size // MB, threads]
+                if args.direction in ('upload', 'both'):
+                    seconds = timed(lambda: app_module.resumable_upload_file(s3, path, bucket_name, key, config))
+                    row.append(f'{size_mb / seconds:.1f}')
+                if args.direction in ('download', 'both'):
+                    if args.direction == 'download' and not rows:
+                        s3.upload_file(path, bucket_name, key)
+                    # Without the local file the finished checkpoint no longer counts
+                    if os.path.exists(download_path):
+                        os.remove(download_path)
+                    seconds = timed(lambda: app_module.resumable_download_file(s3, bucket_name, key, download_path, config))
+                    row.append(f'{size_mb / seconds:.1f}')
+                row.append('<- transfer_settings_for' if (part_size, threads) == picked else '')
+                rows.append(row)
+                # moto holds on to overwritten objects' memory, so start each combination clean
+                if args.direction != 'download':
+                    s3.delete_object(Bucket=bucket_name, Key=key)
+            if os.path.exists(download_path):
+                os.remove(download_path)
+            s3.delete_object(Bucket=bucket_name, Key=key)
+
+            headers = ['part MB', 'threads']
+            headers += ['upload MB/s'] if args.direction in ('upload', 'both') else []
+            headers += ['download MB/s'] if args.direction in ('download', 'both') else []
+            print(f'\n{size_mb} MB file against {endpoint}')
+            print_table(headers + [''], rows)
+    finally:
+        if process:
+            process.terminate()
+
+
+if __name__ == '__main__':
+    main()
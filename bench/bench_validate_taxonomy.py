@@ -0,0 +1,101 @@
+"""
+Rows/sec of /validate-taxonomy on a synthetic full segment file: the original
+per-taxonomy-row loop (on its first --legacy-rows rows, as it was capped), the
+single-pass count over the gzip TSV, and the count over the Parquet copy.
+Both counts are checked against /segments/<id>/count; the synthetic file
+repeats IDs within rows, which must only count once per row.
+
+    python bench/bench_validate_taxonomy.py --rows 2000000
+"""
+import os
+import shutil
+import time
+
+from common import REPO_ROOT, import_main, parse_args, print_table
+from synthetic import ensure_assets, taxonomy_file_name
+
+
+def configure(parser):
+    parser.add_argument('--rows', type=int, default=2000000, help='rows in the synthetic segment file')
+    parser.add_argument('--segments', type=int, default=400, help='distinct segment IDs (= taxonomy rows)')
+    parser.add_argument('--legacy-rows', type=int, default=10000, help='rows counted by the original loop')
+    parser.add_argument('--data-dir', default=os.path.join(REPO_ROOT, 'bench', 'data', 'validate_taxonomy'))
+
+
+def legacy_counts(taxonomy_path, segment_path, nrows):
+    # The original implementation, kept here for comparison
+    import pandas as pd
+
+    taxonomy_df = pd.read_csv(taxonomy_path, sep='\t', header=None, names=['Segment ID', 'Segment Name', 'Price', 'Status'])
+    segment_df = pd.read_csv(segment_path, sep='\t', nrows=nrows)
+    results = []
+    for _, row in taxonomy_df.iterrows():
+        count = segment_df['segment-ids'].apply(lambda x: str(row['Segment ID']) in str(x).split(',')).sum()
+        results.append({'Segment Name': row['Segment Name'], 'Count': int(count)})
+    return results
+
+
+def check_against_membership_index(client, counts):
+    # /segments/<id>/count deduplicates per IP, so every segment must agree
+    mismatches = []
+    for row in counts:
+        segment_id = str(row['Segment ID'])
+        members = client.get(f'/segments/{segment_id}/count').get_json()['ips']
+        if members != row['Count']:
+            mismatches.append((segment_id, row['Count'], members))
+    assert not mismatches, f'/validate-taxonomy and /segments/<id>/count differ: {mismatches[:5]}'
+
+
+def main():
+    args = parse_args(__doc__, configure, s3=False)
+    segment_path, taxonomy_path = ensure_assets(os.path.join(args.data_dir, 'assets'), args.rows, args.segments)
+    os.chdir(args.data_dir)
+    shutil.rmtree(os.path.join('state', 'parquet'), ignore_errors=True)
+    app_module = import_main()
+    client = app_module.app.test_client()
+    url = f'/validate-taxonomy?taxonomy-file={taxonomy_file_name()}'
+    results = []
+
+    def add_result(path, rows, elapsed):
+        results.append([path, rows, f'{elapsed:.2f}', f'{rows / elapsed:,.0f}'])
+
+    started = time.perf_counter()
+    legacy_counts(taxonomy_path, segment_path, args.legacy_rows)
+    add_result('original loop', args.legacy_rows, time.perf_counter() - started)
+
+    # Keep the endpoint on the TSV path, without a background conversion competing for CPU
+    parquet_available = app_module.parquet_available
+    app_module.parquet_available = lambda: False
+    started = time.perf_counter()
+    response = client.get(url)
+    elapsed = time.perf_counter() - started
+    assert response.status_code == 200, response.get_data(as_text=True)
+    add_result(f'gzip TSV, workers={app_module.SEGMENT_PARSE_WORKERS}', args.rows, elapsed)
+    tsv_seconds = elapsed
+    tsv_counts = response.get_json()
+    check_against_membership_index(client, tsv_counts)
+
+    app_module.parquet_available = parquet_available
+    if parquet_available():
+        started = time.perf_counter()
+        app_module.convert_to_parquet(segment_path)
+        app_module.convert_to_parquet(taxonomy_path)
+        # Paid once per file, in the background after it lands in assets/
+        conversion_seconds = time.perf_counter() - started
+        add_result('Parquet conversion', args.rows, conversion_seconds)
+        started = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - started
+        add_result('Parquet copy', args.rows, elapsed)
+        assert response.get_json() == tsv_counts, 'Parquet and TSV counts differ'
+        print(f'Parquet copy is {tsv_seconds / elapsed:.1f}x faster than the gzip TSV; the conversion '
+              f'pays for itself after {conversion_seconds / max(tsv_seconds - elapsed, 1e-9):.1f} requests')
+    else:
+        print('pyarrow is not installed, skipping the Parquet run')
+
+    print(f'/validate-taxonomy, {args.rows} rows x {args.segments} segments')
+    print_table(['path', 'rows', 'seconds', 'rows/sec'], results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+Shared helpers for the benchmarks in this directory: a local S3 stand-in and a
+way to import main.py against it.
+
+By default a moto server is started on a free port for the duration of the run
+(pip install "moto[server]"). Pass --endpoint to use a running MinIO or moto
+server instead.
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MB = 1024 * 1024
+
+
+def parse_args(description, configure=None, s3=True):
+    parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+    if s3:
+        parser.add_argument('--endpoint', help='S3 endpoint to use instead of starting a moto server')
+        parser.add_argument('--access-key', default=os.getenv('AWS_ACCESS_KEY_ID', 'bench'))
+        parser.add_argument('--secret-key', default=os.getenv('AWS_SECRET_ACCESS_KEY', 'bench'))
+    if configure:
+        configure(parser)
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_s3_stand_in(args):
+    """
+    Point every S3 client built from now on (including main.get_s3_client) at the
+    stand-in. Returns (endpoint_url, process), process being None for --endpoint.
+    """
+    process = None
+    endpoint = args.endpoint
+    if not endpoint:
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'moto.server', '-p', str(port)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        endpoint = f'http://127.0.0.1:{port}'
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(endpoint, timeout=1)
+                break
+            except Exception:
+                time.sleep(0.1)
+        else:
+            process.kill()
+            raise RuntimeError('moto server did not start; pip install "moto[server]" or pass --endpoint')
+
+    # botocore picks the endpoint up from the environment, so main.py runs unchanged
+    os.environ['AWS_ENDPOINT_URL_S3'] = endpoint
+    for name in ('AWS_ACCESS_KEY_ID', 'TRITON_ACCESS_KEY'):
+        os.environ[name] = args.access_key
+    for name in ('AWS_SECRET_ACCESS_KEY', 'TRITON_SECRET_ACCESS_KEY'):
+        os.environ[name] = args.secret_key
+    return endpoint, process
+
+
+def import_main():
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    import main
+    return main
+
+
+def create_bucket(s3, bucket_name):
+    region = s3.meta.region_name
+    if region and region != 'us-east-1':
+        s3.create_bucket(Bucket=bucket_name, CreateBucketConfiguration={'LocationConstraint': region})
+    else:
+        s3.create_bucket(Bucket=bucket_name)
+
+
+def print_table(headers, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(headers, *rows)]
+    for row in [headers, ['-' * width for width in widths]] + rows:
+        print('  '.join(str(value).rjust(width) for value, width in zip(row, widths)))
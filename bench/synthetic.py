@@ -0,0 +1,60 @@
+"""
+Synthetic segment and taxonomy files in the Near export format, for benchmarks.
+"""
+import gzip
+import os
+import random
+
+
+def segment_file_name(date='20240207', kind='full', version=1):
+    return f'{kind}.{date}.{version:03d}.ip.tsv.gz'
+
+
+def taxonomy_file_name(date='20240207', version=1):
+    return f'{date}.{version:03d}.taxonomy.tsv.gz'
+
+
+def make_segment_file(path, rows, segments=400, max_segments_per_ip=6, seed=1):
+    """
+    Write a gzip TSV of `rows` IPs with 0..max_segments_per_ip segment IDs each,
+    drawn with replacement from `segments` IDs starting at 1000, so an ID can
+    repeat within a row. Some rows use ", " separators, as the real exports do.
+    """
+    rng = random.Random(seed)
+    segment_ids = [str(1000 + i) for i in range(segments)]
+    with gzip.open(path, 'wt', compresslevel=6) as tsv_file:
+        tsv_file.write('ip\tsegment-ids\n')
+        lines = []
+        for i in range(rows):
+            count = rng.randint(0, max_segments_per_ip)
+            separator = ', ' if count == 3 else ','
+            ids = separator.join(rng.choice(segment_ids) for _ in range(count))
+            lines.append(f'10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}\t{ids}\n')
+            if len(lines) == 100000:
+                tsv_file.writelines(lines)
+                lines = []
+        tsv_file.writelines(lines)
+    return path
+
+
+def make_taxonomy_file(path, segments=400):
+    with gzip.open(path, 'wt') as tsv_file:
+        for i in range(segments):
+            tsv_file.write(f'{1000 + i}\tSegment {1000 + i}\t1.5\tActive\n')
+    return path
+
+
+def ensure_assets(directory, rows, segments=400):
+    # Reuse files from an earlier run with the same parameters
+    os.makedirs(directory, exist_ok=True)
+    segment_path = os.path.join(directory, segment_file_name())
+    taxonomy_path = os.path.join(directory, taxonomy_file_name())
+    marker = os.path.join(directory, f'.rows-{rows}-segments-{segments}')
+    if not os.path.exists(marker):
+        for name in os.listdir(directory):
+            if name.startswith('.rows-'):
+                os.remove(os.path.join(directory, name))
+        make_segment_file(segment_path, rows, segments)
+        make_taxonomy_file(taxonomy_path, segments)
+        open(marker, 'w').close()
+    return segment_path, taxonomy_path
@@ -0,0 +1,18 @@
+# Production settings for `gunicorn -c gunicorn.conf.py main:app`
+import os
+
+bind = f"{os.getenv('WEB_HOST', '0.0.0.0')}:{os.getenv('WEB_PORT', '3000')}"
+workers = int(os.getenv('WEB_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('WEB_THREADS', '16'))
+
+# Transfers can hold a request open for a long time, so don't kill busy workers
+timeout = 0
+# Workers get this long to finish in-flight requests and jobs after SIGTERM
+graceful_timeout = int(os.getenv('SHUTDOWN_DRAIN_SECONDS', '300'))
+
+
+def worker_exit(server, worker):
+    # Requests are finished by gunicorn itself; wait for background jobs too
+    import main
+    main.drain_for_shutdown()